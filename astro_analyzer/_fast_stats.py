@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Optional Numba kernels for per-tile statistics (used when numba is installed).
+
+import numpy as np
+
+try:
+    from numba import njit, prange, get_num_threads
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+# "No upper bound" for float32 data; kept finite because the fastmath kernels assume no infinities
+NO_UPPER = float(np.finfo(np.float32).max)
+
+
+if HAVE_NUMBA:
+
+    @njit(parallel=True, cache=True)
+    def _extent(x, upper):
+        # min, max and count of values <= upper (no fastmath: infinities are meaningful here)
+        lo = np.inf
+        hi = -np.inf
+        n = 0
+        for i in prange(x.size):
+            v = x[i]
+            if v <= upper:
+                lo = min(lo, v)
+                hi = max(hi, v)
+                n += 1
+        return lo, hi, n
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _histogram(x, lo, hi, upper, nbins, nchunk):
+        # One private histogram per thread, merged at the end (no atomics needed).
+        n = x.size
+        step = (n + nchunk - 1) // nchunk
+        scale = nbins / (hi - lo) if hi > lo else 0.0
+        hists = np.zeros((nchunk, nbins), dtype=np.int64)
+        for c in prange(nchunk):
+            for i in range(c * step, min(n, (c + 1) * step)):
+                if x[i] > upper:
+                    continue
+                b = int((x[i] - lo) * scale)
+                if b < 0:
+                    b = 0
+                elif b >= nbins:
+                    b = nbins - 1
+                hists[c, b] += 1
+        return hists.sum(axis=0)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _abs_dev_histogram(x, center, hi, upper, nbins, nchunk):
+        n = x.size
+        step = (n + nchunk - 1) // nchunk
+        scale = nbins / hi if hi > 0 else 0.0
+        hists = np.zeros((nchunk, nbins), dtype=np.int64)
+        for c in prange(nchunk):
+            for i in range(c * step, min(n, (c + 1) * step)):
+                if x[i] > upper:
+                    continue
+                b = int(abs(x[i] - center) * scale)
+                if b >= nbins:
+                    b = nbins - 1
+                hists[c, b] += 1
+        return hists.sum(axis=0)
+
+    @njit(cache=True)
+    def _hist_median(hist, lo, hi, n):
+        # Median by prefix sum, linearly interpolated inside the median bin.
+        nbins = hist.size
+        width = (hi - lo) / nbins
+        target = 0.5 * n
+        cum = 0
+        for b in range(nbins):
+            cnt = hist[b]
+            if cum + cnt >= target:
+                frac = (target - cum) / cnt if cnt > 0 else 0.5
+                return lo + (b + frac) * width
+            cum += cnt
+        return hi
+
+    @njit(cache=True)
+    def _mad_sigma(x, nbins, nchunk, upper, min_count):
+        lo, hi, n = _extent(x, upper)
+        if n < min_count:
+            upper = NO_UPPER
+            lo, hi, n = _extent(x, upper)
+        if hi <= lo:
+            return 1e-12
+        med = _hist_median(_histogram(x, lo, hi, upper, nbins, nchunk), lo, hi, n)
+        span = max(hi - med, med - lo)
+        mad = _hist_median(_abs_dev_histogram(x, med, span, upper, nbins, nchunk), 0.0, span, n)
+        return 1.4826 * mad + 1e-12
+
+    @njit(fastmath=True, cache=True)
+    def _moment_sums(lbl, ys, xs, w, n):
+        # Single streaming pass; rows: sum w, w*x, w*y, w*x*x, w*y*y, w*x*y, ref y, ref x.
+        # Coordinates are taken relative to the first pixel of each label to avoid cancellation.
+        sums = np.zeros((8, n), dtype=np.float64)
+        seen = np.zeros(n, dtype=np.bool_)
+        for i in range(lbl.size):
+            k = lbl[i]
+            if not seen[k]:
+                seen[k] = True
+                sums[6, k] = ys[i]
+                sums[7, k] = xs[i]
+            wi = w[i]
+            x = xs[i] - sums[7, k]
+            y = ys[i] - sums[6, k]
+            wxi = wi * x
+            wyi = wi * y
+            sums[0, k] += wi
+            sums[1, k] += wxi
+            sums[2, k] += wyi
+            sums[3, k] += wxi * x
+            sums[4, k] += wyi * y
+            sums[5, k] += wxi * y
+        return sums
+
+
+def mad_sigma(x: np.ndarray, upper: float = NO_UPPER, min_count: int = 100, nbins: int = 4096) -> float:
+    """
+    Approximate robust sigma (1.4826 * MAD) from two streaming histogram passes
+    (binmedian), without sorting or allocating |x - median|. Requires numba.
+    Only values <= upper take part, unless fewer than min_count of them remain
+    (same as x[x <= upper] with a fallback to x, but without building the subset).
+    """
+    flat = np.ascontiguousarray(x, dtype=np.float32).ravel()
+    return float(_mad_sigma(flat, nbins, get_num_threads(), min(float(upper), NO_UPPER), min_count))
+
+
+def moment_sums(lbl: np.ndarray, ys: np.ndarray, xs: np.ndarray, w: np.ndarray, n: int) -> np.ndarray:
+    """
+    Per-label weighted moment sums (8, n) in one pass over the pixels. Coordinates are relative
+    to a per-label reference pixel (ry, rx): rows are sum(w), sum(w*x), sum(w*y), sum(w*x*x),
+    sum(w*y*y), sum(w*x*y), ry, rx. Requires numba.
+    """
+    return _moment_sums(lbl, ys, xs, np.ascontiguousarray(w, dtype=np.float64), n)
@@ -2,13 +2,15 @@
 # -*- coding: utf-8 -*-
 
 import os
+import importlib.util
 import csv
-import math
 import argparse
+from functools import lru_cache
 from dataclasses import dataclass
 from typing import List, Dict, Tuple, Iterable, Optional
 
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 import tifffile as tiff
 from tqdm import tqdm
 from concurrent.futures import ProcessPoolExecutor, as_completed
@@ -18,6 +20,23 @@ try:
 except ImportError:
     raise SystemExit("scipy is required: pip install scipy")
 
+try:
+    import bottleneck as bn  # optional: faster block medians
+except ImportError:
+    bn = None
+
+try:
+    import zarr  # optional: lazy reads of compressed TIFFs
+except ImportError:
+    zarr = None
+
+try:
+    import numexpr as ne  # optional: multi-threaded threshold pass
+except ImportError:
+    ne = None
+
+from _fast_stats import HAVE_NUMBA, mad_sigma, moment_sums
+
 
 # Config
 
@@ -42,12 +61,41 @@ class Config:
     bkg_block: int = 64
     clip_high_percentile: float = 95.0
     percentile_sample_step: int = 8
+    bkg_quantize: bool = True
+
+    # "cpu" (scipy) or "cuda" (cupy) connected-component labelling
+    device: str = "cpu"
+
+
+# Below this size the exact np.median MAD is cheap enough
+MAD_NUMBA_MIN_SIZE = 50_000
 
 
 # Utilities
 
-def robust_sigma_mad(x: np.ndarray) -> float:
-    #Robust sigma estimate via MAD.
+# Worker-local reusable buffers, keyed by (name, dtype); grown on demand, never shrunk
+_SCRATCH: Dict[Tuple[str, np.dtype], np.ndarray] = {}
+
+
+def _scratch(name: str, shape: Tuple[int, ...], dtype) -> np.ndarray:
+    # Contiguous view of a per-process buffer; valid until the next request for the same name
+    key = (name, np.dtype(dtype))
+    n = int(np.prod(shape))
+    buf = _SCRATCH.get(key)
+    if buf is None or buf.size < n:
+        buf = _SCRATCH[key] = np.empty(n, dtype=dtype)
+    return buf[:n].reshape(shape)
+
+
+def robust_sigma_mad(x: np.ndarray, upper: Optional[float] = None) -> float:
+    #Robust sigma estimate via MAD (histogram approximation via numba for large inputs).
+    #With upper, only values <= upper are used (all of x if fewer than 100 remain).
+    if HAVE_NUMBA and x.size > MAD_NUMBA_MIN_SIZE:
+        return mad_sigma(x) if upper is None else mad_sigma(x, upper)
+    if upper is not None:
+        core = x[x <= upper]
+        if core.size >= 100:
+            x = core
     med = np.median(x)
     mad = np.median(np.abs(x - med))
     return 1.4826 * mad + 1e-12  # avoid division by zero
@@ -63,304 +111,528 @@ def iter_tiles(h: int, w: int, tile: int, overlap: int) -> Iterable[Tuple[int, i
             yield y0, y1, x0, x1
 
 
-def classify_object(area: int, ellipticity: float, peak: float, flux: float) -> str:
-    if area < 40 and ellipticity < 0.35 and peak > 0 and flux > 0:
-        return "star"
-    if area > 120 or ellipticity > 0.55:
-        return "extended"
-    return "unknown"
+@lru_cache(maxsize=64)
+def tile_boxes(h: int, w: int, tile: int, overlap: int) -> Tuple[Tuple[int, int, int, int], ...]:
+    # iter_tiles materialized once per image shape (mosaics usually share a handful of shapes).
+    return tuple(iter_tiles(h, w, tile, overlap))
+
+
+# Object records (one row per detection); "type" is an index into OBJ_TYPES
+OBJ_TYPES = ("star", "extended", "unknown")
+OBJ_DTYPE = np.dtype([
+    ("x", "f8"), ("y", "f8"), ("flux", "f8"), ("peak", "f8"), ("area", "i4"),
+    ("ellipticity", "f8"), ("major", "f8"), ("minor", "f8"), ("type", "u1"),
+])
+
+
+def classify_objects(area: np.ndarray, ellipticity: np.ndarray, peak: np.ndarray, flux: np.ndarray) -> np.ndarray:
+    # Vectorized classification -> OBJ_TYPES codes.
+    star = (area < 40) & (ellipticity < 0.35) & (peak > 0) & (flux > 0)
+    extended = (area > 120) | (ellipticity > 0.55)
+    return np.select([star, extended], [0, 1], default=2).astype(np.uint8)
 
 
-def region_moments(coords_y: np.ndarray, coords_x: np.ndarray, weights: np.ndarray) -> Tuple[float, float, float]:
+def label_moments(lbl: np.ndarray, ys: np.ndarray, xs: np.ndarray, weights: np.ndarray,
+                  wsum: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     """
-    Ellipticity from normalized central second moments.
-    Returns (ellipticity, major, minor) approximately.
+    Intensity-weighted centroids and ellipticity from normalized central second moments,
+    for all labels at once. lbl/ys/xs/weights are per-pixel; wsum[lab] is the weight sum per label.
+    Returns per-label arrays (cx, cy, ellipticity, major, minor) indexed like wsum.
     """
-    wsum = np.sum(weights) + 1e-12
-    x = coords_x.astype(np.float64)
-    y = coords_y.astype(np.float64)
-    wx = np.sum(weights * x) / wsum
-    wy = np.sum(weights * y) / wsum
+    n = wsum.size
+    wsum = wsum + 1e-12
+
+    if HAVE_NUMBA:
+        # One fused pass for all six sums; central moments from raw ones
+        _, swx, swy, swxx, swyy, swxy, ry, rx = moment_sums(lbl, ys, xs, weights, n)
+        mx = swx / wsum
+        my = swy / wsum
+        mu20 = swxx / wsum - mx * mx
+        mu02 = swyy / wsum - my * my
+        mu11 = swxy / wsum - mx * my
+        cx = rx + mx
+        cy = ry + my
+    else:
+        cx = np.bincount(lbl, weights=weights * xs, minlength=n) / wsum
+        cy = np.bincount(lbl, weights=weights * ys, minlength=n) / wsum
 
-    dx = x - wx
-    dy = y - wy
+        dx = xs - cx[lbl]
+        dy = ys - cy[lbl]
 
-    mu20 = np.sum(weights * dx * dx) / wsum
-    mu02 = np.sum(weights * dy * dy) / wsum
-    mu11 = np.sum(weights * dx * dy) / wsum
+        mu20 = np.bincount(lbl, weights=weights * dx * dx, minlength=n) / wsum
+        mu02 = np.bincount(lbl, weights=weights * dy * dy, minlength=n) / wsum
+        mu11 = np.bincount(lbl, weights=weights * dx * dy, minlength=n) / wsum
 
     # Eigenvalues of the covariance matrix
     tr = mu20 + mu02
     det = mu20 * mu02 - mu11 * mu11
-    disc = max(tr * tr - 4.0 * det, 0.0)
-    l1 = 0.5 * (tr + math.sqrt(disc))
-    l2 = 0.5 * (tr - math.sqrt(disc))
-
-    major = math.sqrt(max(l1, 0.0))
-    minor = math.sqrt(max(l2, 0.0))
-    if major <= 1e-12:
-        return 0.0, major, minor
+    disc = np.sqrt(np.maximum(tr * tr - 4.0 * det, 0.0))
+    major = np.sqrt(np.maximum(0.5 * (tr + disc), 0.0))
+    minor = np.sqrt(np.maximum(0.5 * (tr - disc), 0.0))
 
-    ellipticity = 1.0 - (minor / major)
-    return float(ellipticity), float(major), float(minor)
+    round_ = major <= 1e-12
+    ellipticity = np.where(round_, 0.0, 1.0 - minor / np.where(round_, 1.0, major))
+    return cx, cy, ellipticity, major, minor
 
 
 # Background estimation
 
-def _percentile_fast(arr: np.ndarray, q: float, step: int) -> float:
+def _percentiles_fast(arr: np.ndarray, qs: Tuple[float, ...], step: int) -> Tuple[float, ...]:
+    """
+    Linear-interpolated percentiles (same as np.percentile) of a strided sample,
+    using one O(N) np.partition for all requested order statistics instead of sorting.
+    """
     flat = arr.ravel()
-    if step <= 1 or flat.size < 10000:
-        return float(np.percentile(flat, q))
-    sample = flat[::step]
-    return float(np.percentile(sample, q))
+    sample = flat if (step <= 1 or flat.size < 10000) else flat[::step]
+    n = sample.size
+    if n < 64:
+        return tuple(float(v) for v in np.percentile(sample, qs))
 
+    pos = [q / 100.0 * (n - 1) for q in qs]
+    kth = sorted({k for p in pos for k in (int(p), min(int(p) + 1, n - 1))})
+    part = np.partition(sample, kth)
 
-def background_block_median(tile: np.ndarray, block: int, clip_hi_q: float, sample_step: int) -> np.ndarray:
-    """
-    Fast background map via block-wise median (with reflect padding).
-    Bright pixels are clipped to reduce object influence.
-    """
-    tile_f = tile.astype(np.float32, copy=False)
+    out = []
+    for p in pos:
+        lo = int(p)
+        a = float(part[lo])
+        b = float(part[min(lo + 1, n - 1)])
+        out.append(a + (b - a) * (p - lo))
+    return tuple(out)
 
-    hi = _percentile_fast(tile_f, clip_hi_q, sample_step)
-    clipped = np.minimum(tile_f, hi)
 
-    h, w = clipped.shape
+def _percentile_fast(arr: np.ndarray, q: float, step: int) -> float:
+    return _percentiles_fast(arr, (q,), step)[0]
+
+
+def _as_blocks(arr: np.ndarray, block: int) -> np.ndarray:
+    # 4D (bh, block, bw, block) strided view over the whole-block region of a 2D array (no copy).
+    h, w = arr.shape
+    s0, s1 = arr.strides
+    return as_strided(arr, shape=(h // block, block, w // block, block),
+                      strides=(s0 * block, s0, s1 * block, s1))
+
+
+def _reflect_tail(arr: np.ndarray, block: int, axis: int) -> np.ndarray:
+    # Last (ragged) block along axis, reflect-padded to full size exactly as np.pad(mode="reflect")
+    # on the whole array would produce it, but only padding a narrow strip.
+    n = arr.shape[axis]
+    n0 = (n // block) * block
+    pad = block - (n - n0)
+    strip = np.take(arr, np.arange(max(0, n0 - block), n), axis=axis)
+    pad_width = [(0, 0), (0, 0)]
+    pad_width[axis] = (0, pad)
+    padded = np.pad(strip, pad_width, mode="reflect")
+    return np.take(padded, np.arange(padded.shape[axis] - block, padded.shape[axis]), axis=axis)
+
+
+def _median_blocks(blocks: np.ndarray) -> np.ndarray:
+    # (bh, block, bw, block) -> (bh, bw) medians; bottleneck wants one contiguous axis per median.
+    if bn is None:
+        return np.median(blocks, axis=(1, 3))
+    bh, b0, bw, b1 = blocks.shape
+    rows = blocks.transpose(0, 2, 1, 3).reshape(bh * bw, b0 * b1)
+    return bn.median(rows, axis=1).reshape(bh, bw)
+
+
+def _block_medians(arr: np.ndarray, block: int) -> np.ndarray:
+    h, w = arr.shape
+    bh0, bw0 = h // block, w // block
+    h0, w0 = bh0 * block, bw0 * block
     bh = (h + block - 1) // block
     bw = (w + block - 1) // block
 
-    pad_h = bh * block - h
-    pad_w = bw * block - w
-    padded = np.pad(clipped, ((0, pad_h), (0, pad_w)), mode="reflect")
-
-    reshaped = padded.reshape(bh, block, bw, block)
-    coarse = np.median(reshaped, axis=(1, 3))  # (bh, bw)
-
-    bkg = np.repeat(np.repeat(coarse, block, axis=0), block, axis=1)[:h, :w]
-    return bkg.astype(np.float32, copy=False)
-
-
-def estimate_bkg_and_sigma(tile: np.ndarray, cfg: Config) -> Tuple[float, float, Optional[np.ndarray]]:
+    coarse = np.empty((bh, bw), dtype=np.float32)
+    if bh0 and bw0:
+        coarse[:bh0, :bw0] = _median_blocks(_as_blocks(arr[:h0, :w0], block))
+
+    # Ragged right / bottom strips and the corner block
+    if w0 < w:
+        right = _reflect_tail(arr, block, axis=1)  # (h, block)
+        if bh0:
+            coarse[:bh0, -1] = _median_blocks(_as_blocks(right[:h0], block))[:, 0]
+        if h0 < h:
+            coarse[-1, -1] = np.median(_reflect_tail(right, block, axis=0))
+    if h0 < h and bw0:
+        bottom = _reflect_tail(arr[:, :w0], block, axis=0)  # (block, w0)
+        coarse[-1, :bw0] = _median_blocks(_as_blocks(bottom, block))[0]
+    return coarse
+
+
+def background_block_median(tile: np.ndarray, block: int, clip_hi_q: float, sample_step: int,
+                            quantize: bool = True) -> np.ndarray:
+    """
+    Coarse background map (bh, bw) via block-wise median (ragged edge blocks are reflect padded).
+    Bright pixels are clipped to reduce object influence. tile must be float32.
+    With quantize, medians run on the clipped tile scaled to uint16 over [min, hi]
+    (resolution (hi - min) / 65534, far below the noise), which selects faster than float32.
+    The map is never expanded to tile size: use subtract_block_map() to get the residual.
     """
-    Returns (bkg_scalar, sigma, bkg_map_or_none).
+    hi = _percentile_fast(tile, clip_hi_q, sample_step)
+    clipped = np.minimum(tile, hi)
+
+    lo = float(clipped.min())
+    if not quantize or hi <= lo:
+        return _block_medians(clipped, block)
+
+    scale = 65534.0 / (hi - lo)
+    clipped -= lo
+    clipped *= scale
+    coarse = _block_medians(clipped.astype(np.uint16), block)
+    # Truncation put each value at its bin floor: dequantize to bin centers
+    return (lo + (coarse + 0.5) / scale).astype(np.float32)
+
+
+def subtract_block_map(tile: np.ndarray, coarse: np.ndarray, block: int,
+                       out: Optional[np.ndarray] = None) -> np.ndarray:
+    # residual = tile - coarse map expanded to block size, via broadcasting on 4D block views.
+    h, w = tile.shape
+    bh0, bw0 = h // block, w // block
+    h0, w0 = bh0 * block, bw0 * block
+
+    resid = np.empty((h, w), dtype=np.float32) if out is None else out
+    np.subtract(_as_blocks(tile[:h0, :w0], block), coarse[:bh0, None, :bw0, None],
+                out=_as_blocks(resid[:h0, :w0], block))
+    if w0 < w:
+        np.subtract(tile[:h0, w0:].reshape(bh0, block, w - w0), coarse[:bh0, -1, None, None],
+                    out=resid[:h0, w0:].reshape(bh0, block, w - w0))
+    if h0 < h:
+        np.subtract(tile[h0:, :w0].reshape(h - h0, bw0, block), coarse[-1, :bw0, None],
+                    out=resid[h0:, :w0].reshape(h - h0, bw0, block))
+        if w0 < w:
+            np.subtract(tile[h0:, w0:], coarse[-1, -1], out=resid[h0:, w0:])
+    return resid
+
+
+def block_map_median(coarse: np.ndarray, h: int, w: int, block: int) -> float:
+    # Median of the coarse map expanded to (h, w) without expanding it: weight blocks by pixel count.
+    rows = np.full(coarse.shape[0], block, dtype=np.int64)
+    cols = np.full(coarse.shape[1], block, dtype=np.int64)
+    rows[-1] = h - block * (coarse.shape[0] - 1)
+    cols[-1] = w - block * (coarse.shape[1] - 1)
+
+    vals = coarse.ravel()
+    order = np.argsort(vals, kind="stable")
+    cum = np.cumsum(np.outer(rows, cols).ravel()[order])
+    n = h * w
+    lo = vals[order[np.searchsorted(cum, (n - 1) // 2, side="right")]]
+    hi = vals[order[np.searchsorted(cum, n // 2, side="right")]]
+    return float((np.float64(lo) + np.float64(hi)) / 2.0)
+
+
+def estimate_bkg_and_sigma(tile: np.ndarray, cfg: Config) -> Tuple[float, float, np.ndarray]:
+    """
+    Returns (bkg_scalar, sigma, residual) for a float32 tile.
     Detection is performed on residual:
-        residual = tile - bkg_map  (or tile - bkg_scalar)
+        residual = subtract_block_map(tile, bkg_map, block)  (or tile - bkg_scalar)
+    The residual lives in a worker scratch buffer and is overwritten by the next call.
     """
+    resid = _scratch("resid", tile.shape, np.float32)
     if cfg.bkg_mode == "block":
         bkg_map = background_block_median(
             tile=tile,
             block=cfg.bkg_block,
             clip_hi_q=cfg.clip_high_percentile,
             sample_step=cfg.percentile_sample_step,
+            quantize=cfg.bkg_quantize,
         )
-        resid = tile.astype(np.float32, copy=False) - bkg_map
+        subtract_block_map(tile, bkg_map, cfg.bkg_block, out=resid)
 
         # Clip bright residual tail to avoid stars inflating sigma
+        # (the threshold is applied while streaming, no masked copy of resid)
         hi_r = _percentile_fast(resid, 95.0, cfg.percentile_sample_step)
-        core = resid[resid <= hi_r]
-        if core.size < 100:
-            core = resid
-
-        sig = float(robust_sigma_mad(core))
+        sig = float(robust_sigma_mad(resid, upper=hi_r))
         sig = max(sig, cfg.min_sigma)
 
-        bkg_scalar = float(np.median(bkg_map))
-        return bkg_scalar, sig, bkg_map
+        bkg_scalar = block_map_median(bkg_map, tile.shape[0], tile.shape[1], cfg.bkg_block)
+        return bkg_scalar, sig, resid
 
     # Simple scalar background (fallback)
-    tile_f = tile.astype(np.float32, copy=False)
-    hi = _percentile_fast(tile_f, cfg.clip_high_percentile, cfg.percentile_sample_step)
-    core = tile_f[tile_f <= hi]
+    hi = _percentile_fast(tile, cfg.clip_high_percentile, cfg.percentile_sample_step)
+    core = tile[tile <= hi]
     if core.size < 100:
-        core = tile_f
+        core = tile
 
     bkg = float(np.median(core))
     sig_mad = float(robust_sigma_mad(core))
 
-    p16 = _percentile_fast(core, 16.0, cfg.percentile_sample_step)
-    p84 = _percentile_fast(core, 84.0, cfg.percentile_sample_step)
+    p16, p84 = _percentiles_fast(core, (16.0, 84.0), cfg.percentile_sample_step)
     sig_pct = float((p84 - p16) / 2.0)
 
     sig = max(sig_mad, sig_pct, cfg.min_sigma)
-    return bkg, sig, None
+    np.subtract(tile, np.float32(bkg), out=resid)
+    return bkg, sig, resid
 
 
 # Single-tile analysis
 
-def analyze_tile(tile_img: np.ndarray, cfg: Config) -> Tuple[List[Dict], Dict]:
+def _import_cupy():
+    # Imported lazily: only workers of a --device cuda run pay for it (and create a CUDA context).
+    import cupy
+    from cupyx.scipy import ndimage as cndi
+    return cupy, cndi
+
+
+def label_mask(mask: np.ndarray, device: str = "cpu") -> Tuple[np.ndarray, int]:
+    # Connected components of a boolean mask; labels are always returned as a host array.
+    if device == "cuda":
+        cp, cndi = _import_cupy()
+        labels, nlab = cndi.label(cp.asarray(mask))
+        return cp.asnumpy(labels), int(nlab)
+    return ndi.label(mask)
+
+
+def _flat_level(tile: np.ndarray, cfg: Config) -> Optional[float]:
+    # Mid-level of a (near-)constant tile, e.g. blank borders outside the field; None otherwise.
+    # Residuals stay within +-span, so below this span no pixel can pass the threshold or
+    # the peak cut, and the estimated sigma (<= 1.4826 * 2 * span) would clamp to min_sigma.
+    span = min(cfg.min_sigma / 3.0, max(cfg.nsigma * cfg.min_sigma, cfg.min_peak_above_bkg))
+    sample = tile[::16, ::16]
+    if not sample.size or not float(sample.max()) - float(sample.min()) < span:
+        return None
+    lo, hi = float(tile.min()), float(tile.max())
+    if not hi - lo < span:
+        return None
+    return (lo + hi) / 2.0
+
+
+def analyze_tile(tile_img: np.ndarray, cfg: Config) -> Tuple[np.ndarray, Dict]:
     """
-    Analyze one tile and return (objects, tile_stats).
+    Analyze one float32 tile and return (objects, tile_stats); objects is an OBJ_DTYPE array.
     Detection is performed on residual = tile - background.
     """
-    bkg_scalar, sig, bkg_map = estimate_bkg_and_sigma(tile_img, cfg)
+    # Converted once at the read boundary (LazyTiff.read); nothing below casts again
+    assert tile_img.dtype == np.float32, tile_img.dtype
 
-    if bkg_map is None:
-        resid = tile_img.astype(np.float32, copy=False) - bkg_scalar
-    else:
-        resid = tile_img.astype(np.float32, copy=False) - bkg_map
+    flat = _flat_level(tile_img, cfg)
+    if flat is not None:
+        thr = cfg.nsigma * cfg.min_sigma
+        return np.empty(0, dtype=OBJ_DTYPE), {"bkg": flat, "sigma": cfg.min_sigma, "thr": thr, "n": 0, "note": "flat"}
+
+    bkg_scalar, sig, resid = estimate_bkg_and_sigma(tile_img, cfg)
 
     thr = cfg.nsigma * sig
-    mask = resid > thr
+    mask = _scratch("mask", resid.shape, np.bool_)
+    if ne is not None:
+        ne.evaluate("resid > thr", local_dict={"resid": resid, "thr": np.float32(thr)}, out=mask)
+    else:
+        np.greater(resid, thr, out=mask)
 
     if not np.any(mask):
-        return [], {"bkg": bkg_scalar, "sigma": sig, "thr": thr, "n": 0}
+        return np.empty(0, dtype=OBJ_DTYPE), {"bkg": bkg_scalar, "sigma": sig, "thr": thr, "n": 0}
 
-    labels, nlab = ndi.label(mask)
+    labels, nlab = label_mask(mask, cfg.device)
     if nlab == 0:
-        return [], {"bkg": bkg_scalar, "sigma": sig, "thr": thr, "n": 0}
+        return np.empty(0, dtype=OBJ_DTYPE), {"bkg": bkg_scalar, "sigma": sig, "thr": thr, "n": 0}
 
-    # Fast area estimate
-    counts = np.bincount(labels.ravel())
     if nlab > cfg.max_objects_per_tile:
-        return [], {"bkg": bkg_scalar, "sigma": sig, "thr": thr, "n": 0, "note": "too_many_objects"}
-
-    objects: List[Dict] = []
-    slices = ndi.find_objects(labels)
-
-    for lab, slc in enumerate(slices, start=1):
-        if slc is None:
-            continue
-
-        area = int(counts[lab]) if lab < len(counts) else 0
-        if area < cfg.min_area or area > cfg.max_area:
-            continue
-
-        sub_labels = labels[slc]
-        sub_resid = resid[slc]
-
-        m = (sub_labels == lab)
-        if not np.any(m):
-            continue
+        return np.empty(0, dtype=OBJ_DTYPE), {"bkg": bkg_scalar, "sigma": sig, "thr": thr, "n": 0, "note": "too_many_objects"}
+
+    # Per-label reductions over labelled pixels only, for all objects at once.
+    # No bounding boxes needed: labelled pixels are exactly the mask (scanned as bool, not int32)
+    sel = np.flatnonzero(mask)
+    lbl = labels.ravel()[sel]
+    ys, xs = np.divmod(sel, labels.shape[1])
+    area = np.bincount(lbl, minlength=nlab + 1)
+
+    res_px = resid.ravel()[sel]
+
+    # Flux is the sum of background-subtracted positive signal
+    w = np.clip(res_px, 0, None).astype(np.float64)
+    flux = np.bincount(lbl, weights=w, minlength=nlab + 1)
+
+    # peak is residual peak (peak - background)
+    peak = np.full(nlab + 1, -np.inf, dtype=np.float64)
+    np.maximum.at(peak, lbl, res_px)
+
+    keep = (area >= cfg.min_area) & (area <= cfg.max_area)
+    keep &= peak >= cfg.min_peak_above_bkg
+    keep &= (peak / sig) >= cfg.min_snr_peak
+    keep &= flux > 0
+    keep[0] = False
+
+    # Intensity-weighted centroid and shape moments computed on residual weights
+    cx, cy, ellipticity, major, minor = label_moments(lbl, ys, xs, w, flux)
+
+    labs = np.flatnonzero(keep)
+    objects = np.empty(labs.size, dtype=OBJ_DTYPE)
+    objects["x"] = cx[labs]
+    objects["y"] = cy[labs]
+    objects["flux"] = flux[labs]
+    objects["peak"] = peak[labs]
+    objects["area"] = area[labs]
+    objects["ellipticity"] = ellipticity[labs]
+    objects["major"] = major[labs]
+    objects["minor"] = minor[labs]
+    objects["type"] = classify_objects(objects["area"], objects["ellipticity"], objects["peak"], objects["flux"])
 
-        # Residual pixels for this object (already background-subtracted)
-        obj_res = sub_resid[m].astype(np.float32, copy=False)
+    return objects, {"bkg": bkg_scalar, "sigma": sig, "thr": thr, "n": len(objects)}
 
-        peak_above = float(obj_res.max())
-        if peak_above < cfg.min_peak_above_bkg:
-            continue
 
-        snr_peak = peak_above / sig
-        if snr_peak < cfg.min_snr_peak:
-            continue
+# TIFF reading
 
-        # Flux is the sum of background-subtracted positive signal
-        obj_res_pos = np.clip(obj_res, 0, None)
-        flux = float(obj_res_pos.sum())
-        if flux <= 0:
-            continue
+class LazyTiff:
+    """
+    Grayscale float32 tile reader over the first image of a TIFF, without loading it whole.
+
+    Pixel data is a memmap for contiguous uncompressed files, otherwise a zarr view
+    over tifffile's aszarr store (full in-memory read if zarr is not installed).
+    Axes follow series[0].axes:
+      - Y, X:                image plane
+      - S or C of size 3/4:  RGB/RGBA samples (planar or interleaved) -> grayscale
+      - anything else:       pages, Z, T, ... -> first index
+    """
 
-        # Object pixel coordinates within the tile
-        ys_local, xs_local = np.nonzero(m)
-        ys = ys_local + (slc[0].start or 0)
-        xs = xs_local + (slc[1].start or 0)
-
-        # Intensity-weighted centroid and shape moments computed on residual weights
-        w = np.clip(obj_res_pos.astype(np.float64, copy=False), 0, None)
-        wsum = float(np.sum(w)) + 1e-12
-        cx = float(np.sum(xs * w) / wsum)
-        cy = float(np.sum(ys * w) / wsum)
-
-        ellipticity, major, minor = region_moments(ys, xs, w)
-        obj_type = classify_object(area, ellipticity, peak_above, flux)
-
-        objects.append({
-            "x": cx,
-            "y": cy,
-            "flux": flux,
-            "peak": peak_above,  # peak is residual peak (peak - background)
-            "area": area,
-            "ellipticity": ellipticity,
-            "major": major,
-            "minor": minor,
-            "type": obj_type,
-        })
+    def __init__(self, path: str):
+        self.path = path
+        self._tif = tiff.TiffFile(path)
+        series = self._tif.series[0]
+        axes = series.axes
+
+        if "Y" not in axes or "X" not in axes:
+            self.close()
+            raise ValueError(f"Expected a 2D image, got axes={axes} shape={series.shape} for {path}")
+
+        self.shape = (series.shape[axes.index("Y")], series.shape[axes.index("X")])
+
+        # Index template: None marks the Y/X slots filled in per tile
+        index: List = []
+        self._rgb_axis: Optional[int] = None
+        kept = 0
+        for ax, n in zip(axes, series.shape):
+            if ax in "YX":
+                index.append(None)
+                kept += 1
+            elif ax in "SC" and n in (3, 4) and self._rgb_axis is None:
+                index.append(slice(0, 3))
+                self._rgb_axis = kept
+                kept += 1
+            else:
+                index.append(0)
+        self._index = index
+
+        try:
+            self._data = tiff.memmap(path, mode="r")
+        except ValueError:
+            if zarr is not None:
+                self._data = zarr.open(series.aszarr(level=0), mode="r")
+            else:
+                self._data = series.asarray()
+
+    def read(self, y0: int, y1: int, x0: int, x1: int) -> np.ndarray:
+        yx = iter((slice(y0, y1), slice(x0, x1)))
+        key = tuple(next(yx) if i is None else i for i in self._index)
+        part = np.asarray(self._data[key])
+
+        if self._rgb_axis is not None:
+            return part.astype(np.float32, copy=False).mean(axis=self._rgb_axis)
+        return part.astype(np.float32, copy=False)
+
+    def close(self) -> None:
+        self._data = None
+        self._tif.close()
+
+    def __enter__(self) -> "LazyTiff":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
 
-    return objects, {"bkg": bkg_scalar, "sigma": sig, "thr": thr, "n": len(objects)}
 
+def read_tiff(path: str) -> np.ndarray:
+    # Read a whole TIFF into a 2D numpy array (grayscale float32), see LazyTiff for axes handling.
+    with LazyTiff(path) as img:
+        h, w = img.shape
+        return img.read(0, h, 0, w)
 
-# TIFF reading
 
-def read_tiff(path: str) -> np.ndarray:
-    """
-    Read a TIFF into a 2D numpy array (grayscale float32).
-
-    Handles:
-      - 2D grayscale: (H, W)
-      - multi-page:   (pages, H, W) -> first page
-      - RGB/RGBA:     (H, W, C) -> grayscale
-      - planar RGB:   (C, H, W) -> grayscale
-      - multi-page RGB: (pages, H, W, C) -> first page -> grayscale
-    """
-    img = tiff.imread(path)
+# Single file analysis
 
-    # Multi-page RGB: (pages, H, W, C)
-    if img.ndim == 4 and img.shape[-1] in (3, 4):
-        img = img[0]
+Box = Tuple[int, int, int, int]
 
-    # Multi-page grayscale: (pages, H, W)
-    if img.ndim == 3 and img.shape[-1] not in (3, 4) and img.shape[0] > 1 and img.shape[1] > 16 and img.shape[2] > 16:
-        img = img[0]
+# Worker-local cache of the most recently opened TIFF (tile tasks of one file arrive together)
+_OPEN_TIFF: Optional[LazyTiff] = None
 
-    # Planar RGB: (C, H, W)
-    if img.ndim == 3 and img.shape[0] in (3, 4) and img.shape[1] > 16 and img.shape[2] > 16:
-        img = np.moveaxis(img, 0, -1)
 
-    # RGB/RGBA: (H, W, C) -> grayscale
-    if img.ndim == 3 and img.shape[-1] in (3, 4):
-        rgb = img[..., :3].astype(np.float32, copy=False)
-        img = rgb.mean(axis=-1)
+def _open_cached(path: str) -> LazyTiff:
+    global _OPEN_TIFF
+    if _OPEN_TIFF is None or _OPEN_TIFF.path != path:
+        if _OPEN_TIFF is not None:
+            _OPEN_TIFF.close()
+        _OPEN_TIFF = None
+        _OPEN_TIFF = LazyTiff(path)
+    return _OPEN_TIFF
 
-    if img.ndim != 2:
-        raise ValueError(f"Expected a 2D image after conversion, got shape={img.shape} for {path}")
 
-    return img.astype(np.float32, copy=False)
+def read_tiff_header(path: str, cfg: Config) -> Tuple[int, int, List[Box]]:
+    # Image size and tile boxes, without reading pixel data.
+    with LazyTiff(path) as img:
+        h, w = img.shape
+    return h, w, list(tile_boxes(h, w, cfg.tile_size, cfg.overlap))
 
 
-# Single file analysis
+def _analyze_box(tile: np.ndarray, box: Box, cfg: Config) -> Tuple[np.ndarray, Dict]:
+    y0, y1, x0, x1 = box
+    objs, st = analyze_tile(tile, cfg)
+    st.update({"y0": y0, "y1": y1, "x0": x0, "x1": x1})
 
-def analyze_image_file(path: str, cfg: Config) -> Tuple[str, List[Dict], Dict]:
-    # Process one file: tile -> analyze -> collect objects with global coordinates.
-    img = read_tiff(path)
-    h, w = img.shape
+    # Convert tile coordinates to image coordinates
+    objs["x"] += x0
+    objs["y"] += y0
+    return objs, st
 
-    all_objects: List[Dict] = []
-    tile_stats = []
 
-    for (y0, y1, x0, x1) in iter_tiles(h, w, cfg.tile_size, cfg.overlap):
-        tile = img[y0:y1, x0:x1]
-        objs, st = analyze_tile(tile, cfg)
-        st.update({"y0": y0, "y1": y1, "x0": x0, "x1": x1})
-        tile_stats.append(st)
+def analyze_tile_task(path: str, box: Box, cfg: Config) -> Tuple[np.ndarray, Dict]:
+    # Worker task: read and analyze one tile, objects in image coordinates.
+    return _analyze_box(_open_cached(path).read(*box), box, cfg)
 
-        # Convert tile coordinates to image coordinates
-        for o in objs:
-            o["x"] = float(o["x"] + x0)
-            o["y"] = float(o["y"] + y0)
-            all_objects.append(o)
 
-    image_stats = {
+def summarize_image(path: str, h: int, w: int, n_objects: int, tile_stats: List[Dict], cfg: Config) -> Dict:
+    return {
         "file": os.path.basename(path),
         "h": h,
         "w": w,
         "tiles": len(tile_stats),
-        "objects": len(all_objects),
+        "objects": n_objects,
         "bkg_mode": cfg.bkg_mode,
         "median_bkg_mean": float(np.mean([s["bkg"] for s in tile_stats])) if tile_stats else 0.0,
         "sigma_mean": float(np.mean([s["sigma"] for s in tile_stats])) if tile_stats else 0.0,
     }
 
-    return os.path.basename(path), all_objects, image_stats
+
+def analyze_image_file(path: str, cfg: Config) -> Tuple[str, np.ndarray, Dict]:
+    # Process one file: tile -> analyze -> collect objects (OBJ_DTYPE) with global coordinates.
+    # Tiles are read lazily, so peak memory is tile-sized rather than image-sized.
+    with LazyTiff(path) as img:
+        h, w = img.shape
+        results = [_analyze_box(img.read(*box), box, cfg) for box in tile_boxes(h, w, cfg.tile_size, cfg.overlap)]
+
+    tile_objects = [objs for objs, _ in results]
+    tile_stats = [st for _, st in results]
+
+    all_objects = np.concatenate(tile_objects) if tile_objects else np.empty(0, dtype=OBJ_DTYPE)
+    return os.path.basename(path), all_objects, summarize_image(path, h, w, len(all_objects), tile_stats, cfg)
 
 
 # Parallel run + CSV writing
 
 def find_tiff_files(input_dir: str) -> List[str]:
-    exts = (".tif", ".tiff", ".TIF", ".TIFF")
+    # Iterative os.scandir walk: DirEntry type info comes from the directory listing (no stat per file).
+    # Like os.walk, symlinked directories are not followed and unreadable directories are skipped.
+    exts = (".tif", ".tiff")
     paths: List[str] = []
-    for root, _, files in os.walk(input_dir):
-        for fn in files:
-            if fn.endswith(exts):
-                paths.append(os.path.join(root, fn))
+    stack = [input_dir]
+    while stack:
+        root = stack.pop()
+        try:
+            with os.scandir(root) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.lower().endswith(exts) and entry.is_file():
+                        paths.append(entry.path)
+        except OSError:
+            continue
     paths.sort()
     return paths
 
@@ -389,6 +661,10 @@ def main():
     ap.add_argument("--bkg-block", type=int, default=64, help="Block size for block-median background (pixels)")
     ap.add_argument("--clip-high-percentile", type=float, default=95.0, help="Clip bright tail when estimating background")
     ap.add_argument("--percentile-sample-step", type=int, default=8, help="Subsampling step for percentiles (bigger = faster)")
+    ap.add_argument("--bkg-exact", action="store_true",
+                    help="Compute block medians in float32 instead of on a uint16-quantized tile")
+    ap.add_argument("--device", choices=["cpu", "cuda"], default="cpu",
+                    help="Labelling backend: cpu (scipy) or cuda (cupy, needs a GPU)")
 
     args = ap.parse_args()
 
@@ -405,8 +681,14 @@ def main():
         bkg_block=args.bkg_block,
         clip_high_percentile=args.clip_high_percentile,
         percentile_sample_step=args.percentile_sample_step,
+        bkg_quantize=not args.bkg_exact,
+        device=args.device,
     )
 
+    # Only check for cupy here: importing it before the pool forks is best avoided
+    if cfg.device == "cuda" and importlib.util.find_spec("cupy") is None:
+        raise SystemExit("cupy is required for --device cuda: pip install cupy-cuda12x")
+
     files = find_tiff_files(args.input)
     if not files:
         raise SystemExit("No TIFF files found.")
@@ -414,29 +696,61 @@ def main():
     obj_fields = ["file", "obj_id", "x", "y", "flux", "peak", "area", "ellipticity", "major", "minor", "type"]
     img_fields = ["file", "h", "w", "tiles", "objects", "bkg_mode", "median_bkg_mean", "sigma_mean"]
 
-    with open(args.out, "w", newline="", encoding="utf-8") as fobj, \
+    with open(args.out, "w", newline="", encoding="utf-8", buffering=1 << 20) as fobj, \
          open(args.out_images, "w", newline="", encoding="utf-8") as fimg:
 
-        obj_writer = csv.DictWriter(fobj, fieldnames=obj_fields)
+        obj_writer = csv.writer(fobj)
         img_writer = csv.DictWriter(fimg, fieldnames=img_fields)
-        obj_writer.writeheader()
+        obj_writer.writerow(obj_fields)
         img_writer.writeheader()
 
-        with ProcessPoolExecutor(max_workers=args.workers) as ex:
-            futures = {ex.submit(analyze_image_file, p, cfg): p for p in files}
+        def write_file(path: str, job: Dict) -> None:
+            objects = np.concatenate([objs for objs, _ in job["results"]] or [np.empty(0, dtype=OBJ_DTYPE)])
+            tile_stats = [st for _, st in job["results"]]
+            img_writer.writerow(summarize_image(path, job["h"], job["w"], len(objects), tile_stats, cfg))
+
+            # Columns follow OBJ_DTYPE field order; tolist() yields plain Python scalars
+            fname = os.path.basename(path)
+            obj_writer.writerows(
+                (fname, i, *row[:-1], OBJ_TYPES[row[-1]]) for i, row in enumerate(objects.tolist())
+            )
+
+        # One task per tile across all files, so a huge mosaic does not pin a single worker.
+        # A file is written once all of its tiles are done.
+        jobs: Dict[str, Dict] = {}
+        for p in files:
+            try:
+                h, w, boxes = read_tiff_header(p, cfg)
+            except Exception as e:
+                tqdm.write(f"[ERROR] {os.path.basename(p)}: {e}")
+                continue
+            jobs[p] = {"h": h, "w": w, "boxes": boxes, "results": [None] * len(boxes),
+                       "left": len(boxes), "failed": False}
+            if not boxes:
+                write_file(p, jobs.pop(p))
 
-            for fut in tqdm(as_completed(futures), total=len(futures), desc="Processing"):
-                p = futures[fut]
+        with ProcessPoolExecutor(max_workers=args.workers) as ex:
+            futures = {
+                ex.submit(analyze_tile_task, p, box, cfg): (p, i)
+                for p, job in jobs.items()
+                for i, box in enumerate(job["boxes"])
+            }
+
+            for fut in tqdm(as_completed(futures), total=len(futures), desc="Processing tiles"):
+                p, i = futures[fut]
+                job = jobs[p]
                 try:
-                    fname, objects, img_stat = fut.result()
+                    job["results"][i] = fut.result()
                 except Exception as e:
-                    tqdm.write(f"[ERROR] {os.path.basename(p)}: {e}")
-                    continue
-
-                img_writer.writerow(img_stat)
-
-                for i, o in enumerate(objects):
-                    obj_writer.writerow({"file": fname, "obj_id": i, **o})
+                    if not job["failed"]:
+                        tqdm.write(f"[ERROR] {os.path.basename(p)}: {e}")
+                    job["failed"] = True
+
+                job["left"] -= 1
+                if job["left"] == 0:
+                    del jobs[p]
+                    if not job["failed"]:
+                        write_file(p, job)
 
     print(f"Done.\n- Objects: {args.out}\n- Per-image stats: {args.out_images}")
 
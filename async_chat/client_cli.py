@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 import asyncio
+import os
 import sys
 from client_lib import AsyncChatClient
 
+try:
+    import uvloop  # optional: faster event loop
+except ImportError:
+    uvloop = None
+
 
 def fmt(ev: dict) -> str:
     t = ev.get("type")
@@ -23,8 +29,61 @@ def fmt(ev: dict) -> str:
     return str(ev)
 
 
+# Bytes read from stdin but not yet returned as lines
+_stdin_buf = bytearray()
+# None until the first ainput() call decides whether stdin can be watched by the loop
+_stdin_pollable = None
+
+
+async def _stdin_readable(loop: asyncio.AbstractEventLoop, fd: int) -> None:
+    fut = loop.create_future()
+
+    def on_ready() -> None:
+        loop.remove_reader(fd)
+        if not fut.done():
+            fut.set_result(None)
+
+    loop.add_reader(fd, on_ready)
+    try:
+        await fut
+    finally:
+        loop.remove_reader(fd)
+
+
 async def ainput(prompt: str = "") -> str:
-    return (await asyncio.to_thread(lambda: input(prompt))).strip()
+    global _stdin_pollable
+    loop = asyncio.get_running_loop()
+    fd = sys.stdin.fileno()
+
+    if _stdin_pollable is None:
+        # Proactor loops (Windows) and regular files (epoll) cannot be watched
+        try:
+            loop.add_reader(fd, lambda: None)
+            loop.remove_reader(fd)
+            _stdin_pollable = True
+        except (NotImplementedError, OSError, ValueError):
+            _stdin_pollable = False
+    if not _stdin_pollable:
+        return (await asyncio.to_thread(lambda: input(prompt))).strip()
+
+    # Read the fd directly: lines left in sys.stdin's own buffer would not wake the loop
+    if prompt:
+        sys.stdout.write(prompt)
+        sys.stdout.flush()
+    while b"\n" not in _stdin_buf:
+        await _stdin_readable(loop, fd)
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            if not _stdin_buf:
+                raise EOFError
+            break
+        _stdin_buf.extend(chunk)
+
+    end = _stdin_buf.find(b"\n")
+    end = len(_stdin_buf) if end < 0 else end + 1
+    line = bytes(_stdin_buf[:end])
+    del _stdin_buf[:end]
+    return line.decode(sys.stdin.encoding or "utf-8", "replace").strip()
 
 
 async def main() -> None:
@@ -81,4 +140,7 @@ async def main() -> None:
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # loop_factory instead of an event loop policy (policies are deprecated in 3.14);
+    # asyncio.Runner rather than asyncio.run(loop_factory=...), which needs 3.12
+    with asyncio.Runner(loop_factory=uvloop.new_event_loop if uvloop is not None else None) as runner:
+        runner.run(main())
\ No newline at end of file
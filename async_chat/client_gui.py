@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
 import asyncio
+import os
 import threading
-import queue
+from collections import deque
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 
 from client_lib import AsyncChatClient
 
+try:
+    import uvloop  # optional: faster event loop
+except ImportError:
+    uvloop = None
+
+UI_POLL_MS = 100  # fallback poll where Tk has no file handlers (e.g. Windows)
+
 
 class ChatGUI:
     def __init__(self, root: tk.Tk):
@@ -16,7 +24,11 @@ class ChatGUI:
         self.net_thread = None
         self.loop = None
         self.client = None
-        self.ui_q = queue.Queue()
+        # Events from the network thread, drained on the Tk thread. Tk must not be called from
+        # the network thread (no after_idle there), so it wakes Tk through a self-pipe instead.
+        self.ui_q = deque()
+        self._ui_event = threading.Event()  # set while a wake-up is pending
+        self._wake_w = None
 
         # Top panel
         top = ttk.Frame(root, padding=8)
@@ -78,7 +90,13 @@ class ChatGUI:
         self.btn_pm = ttk.Button(bot, text="PM...", command=self.pm_dialog, state="disabled")
         self.btn_pm.pack(side="left", padx=4)
 
-        self.root.after(100, self.poll_ui_queue)
+        if hasattr(self.root.tk, "createfilehandler"):
+            wake_r, self._wake_w = os.pipe()
+            os.set_blocking(wake_r, False)
+            os.set_blocking(self._wake_w, False)
+            self.root.tk.createfilehandler(wake_r, tk.READABLE, self._on_wake)
+        else:
+            self.root.after(UI_POLL_MS, self.poll_ui_queue)
 
     def log(self, s: str):
         self.txt.insert("end", s + "\n")
@@ -110,14 +128,14 @@ class ChatGUI:
         self.btn_connect.config(state="disabled")
 
     def net_worker(self, host, port, name, room):
-        self.loop = asyncio.new_event_loop()
+        self.loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
 
         async def runner():
             self.client = AsyncChatClient(host=host, port=port, name=name, room=room)
 
             async def on_event(ev: dict):
-                self.ui_q.put(ev)
+                self.post_ui(ev)
 
             self.client.on_event = on_event
             await self.client.connect()
@@ -126,16 +144,43 @@ class ChatGUI:
             self.loop.run_until_complete(runner())
             self.loop.run_forever()
         except Exception as e:
-            self.ui_q.put({"type": "error", "text": f"NET error: {e}"})
-
-    def poll_ui_queue(self):
+            self.post_ui({"type": "error", "text": f"NET error: {e}"})
+
+    def post_ui(self, ev: dict):
+        # Called from the network thread: queue only, no Tk calls here.
+        # One wake-up byte per burst of events.
+        self.ui_q.append(ev)
+        if not self._ui_event.is_set():
+            self._ui_event.set()
+            if self._wake_w is not None:
+                try:
+                    os.write(self._wake_w, b"\0")
+                except BlockingIOError:
+                    pass  # pipe full: a wake-up is pending anyway
+
+    def _on_wake(self, fd, mask):
+        # Tk thread, called when the network thread wrote to the wake-up pipe
         try:
-            while True:
-                ev = self.ui_q.get_nowait()
-                self.log(self.format_event(ev))
-        except queue.Empty:
+            os.read(fd, 4096)
+        except BlockingIOError:
             pass
-        self.root.after(100, self.poll_ui_queue)
+        self.drain_ui_queue()
+
+    def poll_ui_queue(self):
+        # Tk thread, fallback only; an idle tick is just a flag check
+        if self._ui_event.is_set():
+            self.drain_ui_queue()
+        self.root.after(UI_POLL_MS, self.poll_ui_queue)
+
+    def drain_ui_queue(self):
+        # Clear first: events appended from now on wake Tk again (or are picked up by this drain)
+        self._ui_event.clear()
+        while True:
+            try:
+                ev = self.ui_q.popleft()
+            except IndexError:
+                break
+            self.log(self.format_event(ev))
 
     def format_event(self, ev: dict) -> str:
         t = ev.get("type")
@@ -1,18 +1,39 @@
 import asyncio
-import base64
 import json
+import mmap
 import os
+import time
 from dataclasses import dataclass, field
-from datetime import datetime
-from typing import Optional, Callable, Awaitable, Dict, List, Tuple
+from typing import Any, BinaryIO, Optional, Callable, Awaitable, Dict, List, Tuple
 
-MAX_LINE_BYTES = 32 * 1024
+try:
+    import orjson  # optional: faster JSON encode/decode
+except ImportError:
+    orjson = None
+
+from protocol import MAX_B64_CHUNK, MAX_BIN_CHUNK, b64decode, b64encode_str
+
+MAX_LINE_BYTES = 256 * 1024   # same as the server: base64 file_chunk lines are up to ~200 KB
+STREAM_LIMIT = 256 * 1024     # StreamReader limit must be >= MAX_LINE_BYTES
 
 
 def dumps(obj: dict) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            pass  # e.g. ints beyond 64 bits: left to the stdlib encoder
     return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
 
 
+def loads(line: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(line)  # parses the bytes directly
+    # Explicit decode on purpose: json.loads(bytes) sniffs the encoding and decodes with
+    # surrogatepass itself, which measured slower (and laxer) than decoding strictly here.
+    return json.loads(line.decode("utf-8"))
+
+
 async def read_json_line(reader: asyncio.StreamReader) -> Optional[dict]:
     line = await reader.readline()
     if not line:
@@ -20,12 +41,20 @@ async def read_json_line(reader: asyncio.StreamReader) -> Optional[dict]:
     if len(line) > MAX_LINE_BYTES:
         return {"type": "error", "text": "Server sent an overly long line"}
     try:
-        return json.loads(line.decode("utf-8"))
+        return loads(line)
     except Exception:
         return {"type": "error", "text": "Server sent invalid JSON"}
 
 
-@dataclass
+@dataclass(slots=True)
+class InFile:
+    # Incoming transfer; updated in place per chunk
+    path: str
+    fh: BinaryIO
+    written: int = 0
+
+
+@dataclass(slots=True)
 class AsyncChatClient:
     host: str
     port: int
@@ -38,14 +67,19 @@ class AsyncChatClient:
     on_event: Optional[Callable[[dict], Awaitable[None]]] = None
     _rx_task: Optional[asyncio.Task] = None
 
-    _in_files: Dict[str, tuple] = field(default_factory=dict, init=False)
+    _in_files: Dict[str, InFile] = field(default_factory=dict, init=False)
 
     _waiters: List[Tuple[Callable[[dict], bool], asyncio.Future]] = field(default_factory=list, init=False)
 
+    # Serializes writes: a file_bin header and its raw payload must not be split by other frames,
+    # and the transport rejects write() while loop.sendfile() is running on it
+    _send_lock: asyncio.Lock = field(default_factory=asyncio.Lock, init=False)
+
     async def connect(self) -> None:
-        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=STREAM_LIMIT)
 
-        await self.send({"type": "hello", "name": self.name})
+        # "bin": we accept file chunks as raw file_bin frames instead of base64 JSON
+        await self.send({"type": "hello", "name": self.name, "bin": True})
         await self.send({"type": "join", "room": self.room})
 
         self._rx_task = asyncio.create_task(self._rx_loop(), name="client-rx")
@@ -69,8 +103,9 @@ class AsyncChatClient:
     async def send(self, obj: dict) -> None:
         if not self.writer:
             return
-        self.writer.write(dumps(obj))
-        await self.writer.drain()
+        async with self._send_lock:
+            self.writer.write(dumps(obj))
+            await self.writer.drain()
 
     async def send_msg(self, text: str) -> None:
         await self.send({"type": "msg", "text": text})
@@ -94,20 +129,23 @@ class AsyncChatClient:
         return fut
 
     def _notify_waiters(self, ev: dict) -> None:
-        if not self._waiters:
-            return
-        for pred, fut in list(self._waiters):
-            if fut.done():
-                self._waiters.remove((pred, fut))
-                continue
-            try:
-                if pred(ev):
-                    fut.set_result(ev)
-                    self._waiters.remove((pred, fut))
-            except Exception:
-                pass
-
-    async def send_file(self, path: str, chunk_size: int = 48 * 1024, ack_timeout: float = 5.0) -> None:
+        # In place, in registration order: no copy of the list per event
+        waiters = self._waiters
+        i = 0
+        while i < len(waiters):
+            pred, fut = waiters[i]
+            if not fut.done():
+                try:
+                    hit = pred(ev)
+                except Exception:
+                    hit = False
+                if not hit:
+                    i += 1
+                    continue
+                fut.set_result(ev)
+            del waiters[i]
+
+    async def send_file(self, path: str, chunk_size: int = 256 * 1024, ack_timeout: float = 5.0) -> None:
         if not self.reader or not self.writer:
             raise RuntimeError("Not connected")
 
@@ -127,22 +165,69 @@ class AsyncChatClient:
         if not fid:
             raise RuntimeError("Server returned file_ack without id")
 
-        seq = 0
+        if ack_ev.get("bin"):
+            await self._send_file_bin(path, fid, min(chunk_size, MAX_BIN_CHUNK))
+            await self.send({"type": "file_end", "id": fid})
+            return
+
+        # Base64 chunks are encoded straight from the mapped file, no read() copy per chunk
+        chunk_size = min(chunk_size, MAX_B64_CHUNK)
         with open(path, "rb") as f:
-            while True:
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                data = base64.b64encode(chunk).decode("ascii")
-                await self.send({"type": "file_chunk", "id": fid, "seq": seq, "data": data})
-                seq += 1
+            size = os.fstat(f.fileno()).st_size
+            if size:  # empty files cannot be mapped
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    mv = memoryview(mm)
+                    try:
+                        for seq, off in enumerate(range(0, size, chunk_size)):
+                            data = b64encode_str(mv[off:off + chunk_size])
+                            await self.send({"type": "file_chunk", "id": fid, "seq": seq, "data": data})
+                    finally:
+                        mv.release()
 
         await self.send({"type": "file_end", "id": fid})
 
+    async def _send_file_bin(self, path: str, fid: str, chunk_size: int) -> None:
+        # Protocol v2: header line + raw bytes per chunk, sent with sendfile(2) where the loop can
+        loop = asyncio.get_running_loop()
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            for seq, off in enumerate(range(0, size, chunk_size)):
+                n = min(chunk_size, size - off)
+                # Held per chunk: other messages go out between chunks, never inside one
+                async with self._send_lock:
+                    self.writer.write(dumps({"type": "file_bin", "id": fid, "seq": seq, "size": n}))
+                    await self.writer.drain()
+                    try:
+                        sent = await loop.sendfile(self.writer.transport, f, off, n)
+                    except (NotImplementedError, AttributeError):
+                        # Loops without sendfile support (e.g. uvloop)
+                        f.seek(off)
+                        data = f.read(n)
+                        sent = len(data)
+                        self.writer.write(data)
+                        await self.writer.drain()
+                    if sent != n:
+                        # The server now expects more bytes than exist; the stream is unusable
+                        self.writer.close()
+                        raise RuntimeError(f"{path} shrank during transfer")
+
+    async def _read_bin_payload(self, ev: dict) -> Optional[dict]:
+        # None when the stream ended or cannot be resynchronized (invalid size)
+        size = ev.get("size")
+        if type(size) is not int or not 0 <= size <= MAX_BIN_CHUNK:
+            return None
+        try:
+            ev["data"] = await self.reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            return None
+        return ev
+
     async def _rx_loop(self) -> None:
         assert self.reader is not None
         while True:
             ev = await read_json_line(self.reader)
+            if ev is not None and ev.get("type") == "file_bin":
+                ev = await self._read_bin_payload(ev)
             if ev is None:
                 # connection closed
                 # fail all pending waiters
@@ -168,25 +253,25 @@ class AsyncChatClient:
             fid = ev.get("id")
             filename = ev.get("filename", "file.bin")
             os.makedirs("downloads", exist_ok=True)
-            outpath = os.path.join("downloads", f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}")
-            fh = open(outpath, "wb")
-            self._in_files[fid] = (outpath, 0, fh)
+            outpath = os.path.join("downloads", f"{time.strftime('%Y%m%d_%H%M%S')}_{filename}")
+            self._in_files[fid] = InFile(outpath, open(outpath, "wb"))
 
-        elif t == "file_chunk":
-            fid = ev.get("id")
-            if fid not in self._in_files:
-                return
-            outpath, written, fh = self._in_files[fid]
-            try:
-                data = base64.b64decode(ev.get("data", "").encode("ascii"), validate=True)
-            except Exception:
+        elif t == "file_chunk" or t == "file_bin":
+            f = self._in_files.get(ev.get("id"))
+            if f is None:
                 return
-            fh.write(data)
-            self._in_files[fid] = (outpath, written + len(data), fh)
+            if t == "file_bin":
+                data = ev["data"]
+            else:
+                try:
+                    data = b64decode(ev.get("data", ""))
+                except Exception:
+                    return
+            f.fh.write(data)
+            f.written += len(data)
 
         elif t == "file_end":
             fid = ev.get("id")
             if fid not in self._in_files:
                 return
-            outpath, written, fh = self._in_files.pop(fid)
-            fh.close()
+            self._in_files.pop(fid).fh.close()
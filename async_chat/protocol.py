@@ -0,0 +1,29 @@
+"""File-transfer limits and base64 helpers shared by the server and the client library."""
+import base64
+import binascii
+
+try:
+    import pybase64  # optional: SIMD base64 for file chunks
+except ImportError:
+    pybase64 = None
+
+MAX_B64_DATA = 200_000        # max chars in the "data" field of one base64 file_chunk
+MAX_B64_CHUNK = 144 * 1024    # raw bytes per base64 file_chunk (196_608 chars <= MAX_B64_DATA)
+# Raw payload cap of one file_bin frame. Kept at the base64 chunk size: queued frames per slow
+# receiver stay bounded (OutQueue holds 200), and the server's file_chunk re-encoding for
+# non-"bin" clients stays within MAX_B64_DATA and the line limits.
+MAX_BIN_CHUNK = MAX_B64_CHUNK
+
+
+def b64encode_str(data: bytes) -> str:
+    if pybase64 is not None:
+        return pybase64.b64encode_as_string(data)
+    return base64.b64encode(data).decode("ascii")
+
+
+def b64decode(data: str) -> bytes:
+    # Strict: raises on characters outside the base64 alphabet
+    if pybase64 is not None:
+        return pybase64.b64decode(data, validate=True)
+    # Same strict decode as b64decode(validate=True), reading an ASCII str in place (no encode copy)
+    return binascii.a2b_base64(data, strict_mode=True)
@@ -3,3 +3,17 @@ from pathlib import Path
 
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT))
+
+import pytest_asyncio
+
+from server import ChatServer
+
+
+@pytest_asyncio.fixture
+async def server_port():
+    srv = ChatServer(host="127.0.0.1", port=0)
+    port = await srv.start()
+    try:
+        yield port
+    finally:
+        await srv.stop()
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import pytest
+
+from client_lib import STREAM_LIMIT, AsyncChatClient, dumps, read_json_line
+from protocol import MAX_B64_DATA, MAX_BIN_CHUNK, b64decode
+
+
+async def connect(port: int, name: str, events: list) -> AsyncChatClient:
+    async def on_event(ev: dict) -> None:
+        events.append(ev)
+
+    c = AsyncChatClient("127.0.0.1", port, name, room="room1", on_event=on_event)
+    await c.connect()
+    return c
+
+
+async def read_until(reader: asyncio.StreamReader, pred, timeout=5.0):
+    async def _inner():
+        while True:
+            ev = await read_json_line(reader)
+            assert ev is not None, "connection closed"
+            if pred(ev):
+                return ev
+    return await asyncio.wait_for(_inner(), timeout=timeout)
+
+
+async def wait_for(pred, timeout=5.0):
+    async def _inner():
+        while not pred():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(_inner(), timeout=timeout)
+
+
+@pytest.mark.asyncio
+async def test_file_bin_round_trip_with_concurrent_messages(server_port, tmp_path, monkeypatch):
+    # Received files go to ./downloads
+    monkeypatch.chdir(tmp_path)
+    payload = os.urandom(1024 * 1024 + 123)
+    src = tmp_path / "blob.bin"
+    src.write_bytes(payload)
+
+    a_events: list = []
+    b_events: list = []
+    alice = await connect(server_port, "alice", a_events)
+    bob = await connect(server_port, "bob", b_events)
+    try:
+        await wait_for(lambda: any("bob joined" in (e.get("text") or "") for e in a_events))
+
+        async def chatter():
+            for i in range(50):
+                await alice.send_msg(f"m{i}")
+                await asyncio.sleep(0)
+
+        # Messages typed while the upload runs must not be lost
+        await asyncio.gather(alice.send_file(str(src), chunk_size=64 * 1024), chatter())
+
+        def msgs():
+            return [e["text"] for e in b_events if e.get("type") == "msg"]
+
+        await wait_for(lambda: len(msgs()) == 50 and any(e.get("type") == "file_end" for e in b_events))
+        assert msgs() == [f"m{i}" for i in range(50)]
+        assert any(e.get("type") == "file_bin" for e in b_events)
+
+        (out,) = (tmp_path / "downloads").iterdir()
+        assert out.name.endswith("_blob.bin")
+        assert out.read_bytes() == payload
+    finally:
+        await alice.close()
+        await bob.close()
+
+
+@pytest.mark.asyncio
+async def test_file_bin_relayed_as_base64_to_text_clients(server_port, tmp_path):
+    payload = os.urandom(300 * 1024)
+    src = tmp_path / "blob.bin"
+    src.write_bytes(payload)
+
+    alice = await connect(server_port, "alice", [])
+    # bob speaks the JSON-only protocol (no "bin" in hello)
+    r, w = await asyncio.open_connection("127.0.0.1", server_port, limit=STREAM_LIMIT)
+    try:
+        w.write(dumps({"type": "hello", "name": "bob"}) + dumps({"type": "join", "room": "room1"}))
+        await w.drain()
+        await read_until(r, lambda e: "You joined room room1" in (e.get("text") or ""))
+
+        await alice.send_file(str(src))
+
+        chunks = []
+        while True:
+            ev = await read_until(r, lambda e: e.get("type") in ("file_chunk", "file_end"))
+            if ev["type"] == "file_end":
+                break
+            assert len(ev["data"]) <= MAX_B64_DATA
+            chunks.append(b64decode(ev["data"]))
+        assert len(chunks) == -(-len(payload) // MAX_BIN_CHUNK)
+        assert b"".join(chunks) == payload
+    finally:
+        w.close()
+        await w.wait_closed()
+        await alice.close()
+
+
+@pytest.mark.asyncio
+async def test_oversized_file_bin_is_rejected(server_port):
+    r, w = await asyncio.open_connection("127.0.0.1", server_port, limit=STREAM_LIMIT)
+    try:
+        w.write(dumps({"type": "file_bin", "id": "x", "seq": 0, "size": MAX_BIN_CHUNK + 1}))
+        await w.drain()
+        ev = await read_until(r, lambda e: e.get("type") == "error")
+        assert ev["text"] == "Invalid file_bin size"
+    finally:
+        w.close()
+        await w.wait_closed()
@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+
+from server import OutQueue
+
+
+@pytest.mark.asyncio
+async def test_put_nowait_raises_when_full():
+    q = OutQueue(maxsize=2)
+    q.put_nowait(b"a")
+    q.put_nowait(b"b")
+    with pytest.raises(asyncio.QueueFull):
+        q.put_nowait(b"c")
+
+
+@pytest.mark.asyncio
+async def test_put_blocks_until_writer_takes_frames():
+    q = OutQueue(maxsize=2)
+    await q.put(1)
+    await q.put(2)
+
+    blocked = asyncio.create_task(q.put(3))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    assert await q.get_batch(1) == [1]
+    await asyncio.wait_for(blocked, timeout=1.0)
+    assert await q.get_batch(10) == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_get_batch_drains_several_in_order_up_to_limit():
+    q = OutQueue(maxsize=10)
+    for i in range(5):
+        q.put_nowait(i)
+    assert await q.get_batch(3) == [0, 1, 2]
+    assert await q.get_batch(3) == [3, 4]
+
+
+@pytest.mark.asyncio
+async def test_get_batch_waits_and_wakes_on_put():
+    q = OutQueue()
+    getter = asyncio.create_task(q.get_batch(8))
+    await asyncio.sleep(0.01)
+    assert not getter.done()
+
+    q.put_nowait(b"x")
+    q.put_nowait(b"y")
+    assert await asyncio.wait_for(getter, timeout=1.0) == [b"x", b"y"]
+
+
+@pytest.mark.asyncio
+async def test_all_blocked_producers_wake_as_space_frees():
+    q = OutQueue(maxsize=1)
+    q.put_nowait(0)
+    producers = [asyncio.create_task(q.put(i)) for i in range(1, 4)]
+    await asyncio.sleep(0.01)
+
+    got = []
+    while len(got) < 4:
+        got += await asyncio.wait_for(q.get_batch(8), timeout=1.0)
+    await asyncio.wait_for(asyncio.gather(*producers), timeout=1.0)
+    assert sorted(got) == [0, 1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_waiters_can_be_cancelled_on_close():
+    # The connection's TaskGroup cancels the write loop (blocked in get_batch) and
+    # producers blocked in put; both must unwind and leave the queue usable.
+    q = OutQueue(maxsize=1)
+    getter = asyncio.create_task(q.get_batch(8))
+    await asyncio.sleep(0.01)
+    getter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await getter
+
+    q.put_nowait(b"a")
+    producer = asyncio.create_task(q.put(b"b"))
+    await asyncio.sleep(0.01)
+    producer.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await producer
+
+    assert await q.get_batch(8) == [b"a"]
+    await asyncio.wait_for(q.put(b"c"), timeout=1.0)
+    assert await q.get_batch(8) == [b"c"]
@@ -1,9 +1,6 @@
 import asyncio
 import json
 import pytest
-import pytest_asyncio
-
-from server import ChatServer
 
 
 def j(obj: dict) -> bytes:
@@ -30,16 +27,6 @@ async def wait_info_contains(reader: asyncio.StreamReader, needle: str, timeout=
     )
 
 
-@pytest_asyncio.fixture
-async def server_port():
-    srv = ChatServer(host="127.0.0.1", port=0)
-    port = await srv.start()
-    try:
-        yield port
-    finally:
-        await srv.stop()
-
-
 @pytest.mark.asyncio
 async def test_join_and_broadcast(server_port):
     port = server_port
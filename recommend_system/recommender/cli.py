@@ -6,12 +6,7 @@ from typing import Optional, List, Dict, Any
 
 from .io_utils import load_books_json, save_recommendations_json, save_recommendations_csv
 from .preprocess import parse_preferences
-from .pipeline import (
-    filter_only_selected_genres,
-    filter_year_min,
-    score_books,
-    sort_recommendations,
-)
+from .pipeline import iter_scored, sort_recommendations
 
 
 def _prompt(msg: str) -> str:
@@ -36,40 +31,45 @@ def _clip(s: str, n: int) -> str:
     return s if len(s) <= n else s[: max(0, n - 1)] + "…"
 
 
-def _print_table(rows: List[Dict[str, Any]], top_n: int = 10) -> None:
-    if not rows:
+def _print_table(shown: List[Dict[str, Any]], total: int) -> None:
+    # shown: the first rows of the ranking; total: size of the whole ranking.
+    if not shown:
         print("\nНет рекомендаций (проверьте фильтры или предпочтения).")
         return
-    shown = rows[:top_n]
-    print("\nРекомендации:")
-    print("-" * 110)
-    print(f"{'№':>2}  {'score':>5}  {'год':>4}  {'жанр':<18}  {'автор':<22}  {'название':<28}  {'описание'}")
-    print("-" * 110)
-    for r in shown:
-        print(
-            f"{r['rank']:>2}  {r['score']:>5}  {r['year']:>4}  "
-            f"{_clip(r['genre'],18):<18}  {_clip(r['author'],22):<22}  {_clip(r['title'],28):<28}  "
-            f"{_clip(r.get('description',''), 60)}"
-        )
-    print("-" * 110)
-    if len(rows) > top_n:
-        print(f"Показано {top_n} из {len(rows)}. Можно сохранить полный список в файл.")
-
-
-def _select_to_read(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    if not rows:
-        return []
+    rule = "-" * 110
+    out = [
+        "\nРекомендации:",
+        rule,
+        f"{'№':>2}  {'score':>5}  {'год':>4}  {'жанр':<18}  {'автор':<22}  {'название':<28}  {'описание'}",
+        rule,
+    ]
+    out.extend(
+        f"{r['rank']:>2}  {r['score']:>5}  {r['year']:>4}  "
+        f"{_clip(r['genre'],18):<18}  {_clip(r['author'],22):<22}  {_clip(r['title'],28):<28}  "
+        f"{_clip(r.get('description',''), 60)}"
+        for r in shown
+    )
+    out.append(rule)
+    if total > len(shown):
+        out.append(f"Показано {len(shown)} из {total}. Можно сохранить полный список в файл.")
+    # One write for the whole table instead of a print() per line.
+    sys.stdout.write("\n".join(out) + "\n")
+
+
+def _select_to_read(total: int) -> set[int]:
+    # Return the chosen ranks (1..total).
+    if not total:
+        return set()
     raw = _prompt("Введите номера понравившихся книг через запятую (или Enter чтобы пропустить): ")
     raw = raw.strip()
     if not raw:
-        return []
+        return set()
     try:
         nums = [int(x.strip()) for x in raw.replace(";", ",").split(",") if x.strip()]
     except ValueError:
         print("Некорректный ввод: ожидались числа.")
-        return []
-    chosen = {n for n in nums if 1 <= n <= len(rows)}
-    return [r for r in rows if r["rank"] in chosen]
+        return set()
+    return {n for n in nums if 1 <= n <= total}
 
 
 def run_cli(data_path: str | Path = "data/books.json") -> int:
@@ -95,21 +95,20 @@ def run_cli(data_path: str | Path = "data/books.json") -> int:
     top_n = _parse_int(_prompt("Сколько показать в консоли? (Enter=10): ")) or 10
 
     books = load_books_json(data_path)
-    if only_selected:
-        books = filter_only_selected_genres(books, prefs["genres"])
-    books = filter_year_min(books, year_min)
-
-    rows = score_books(books, prefs)
-    rows_sorted = sort_recommendations(rows, sort_by=sort_by)
+    rows = list(iter_scored(books, prefs, year_min=year_min, only_selected=only_selected))
 
     any_pref = any(prefs[k] for k in ("genres", "authors", "keywords"))
     if any_pref:
-        rows_sorted = [r for r in rows_sorted if int(r["score"]) > 0]
+        rows = [r for r in rows if int(r["score"]) > 0]
 
-    _print_table(rows_sorted, top_n=top_n)
+    # Only the console top is ranked up front; the full sort is done if the user needs it.
+    _print_table(sort_recommendations(rows, sort_by=sort_by, limit=top_n), total=len(rows))
+    rows_sorted: Optional[List[Dict[str, Any]]] = None
 
-    to_read = _select_to_read(rows_sorted)
-    if to_read:
+    chosen = _select_to_read(len(rows))
+    if chosen:
+        rows_sorted = sort_recommendations(rows, sort_by=sort_by)
+        to_read = [r for r in rows_sorted if r["rank"] in chosen]
         out = Path("out")
         out.mkdir(exist_ok=True)
         save_recommendations_json(out / "to_read.json", to_read)
@@ -117,6 +116,8 @@ def run_cli(data_path: str | Path = "data/books.json") -> int:
 
     save = _prompt("Сохранить рекомендации в файл? (json/csv/нет): ").strip().lower()
     if save in {"json", "csv"}:
+        if rows_sorted is None:
+            rows_sorted = sort_recommendations(rows, sort_by=sort_by)
         out = Path("out")
         out.mkdir(exist_ok=True)
         if save == "json":
@@ -1,18 +1,30 @@
 from __future__ import annotations
 
 import csv
+import io
 import json
+import operator
 from pathlib import Path
-from typing import Iterable, Iterator, Dict, Any, List
+from typing import BinaryIO, TextIO, Iterable, Iterator, Dict, Any
 
 from .models import Book
 
+try:
+    import orjson  # optional: faster JSON encode/decode
+except ImportError:
+    orjson = None
+
+CSV_FIELDS = ("rank", "score", "title", "author", "genre", "year", "description", "matched_keywords")
+
 
 def load_books_json(path: str | Path) -> Iterator[Book]:
     # Generator: yields Book from a JSON array file.
     p = Path(path)
-    with p.open("r", encoding="utf-8") as f:
-        data = json.load(f)
+    if orjson is not None:
+        data = orjson.loads(p.read_bytes())
+    else:
+        with p.open("r", encoding="utf-8") as f:
+            data = json.load(f)
     if not isinstance(data, list):
         raise ValueError("books JSON must be a list of objects")
     for item in data:
@@ -20,20 +32,43 @@ def load_books_json(path: str | Path) -> Iterator[Book]:
             yield Book.from_mapping(item)
 
 
+def write_json(f: BinaryIO, rows: Iterable[Dict[str, Any]]) -> None:
+    # UTF-8 JSON array indented by 2 (same layout with or without orjson).
+    if orjson is not None:
+        f.write(orjson.dumps(rows if isinstance(rows, list) else list(rows), option=orjson.OPT_INDENT_2))
+        return
+    # Stream one row at a time instead of materializing the whole document.
+    enc = json.JSONEncoder(ensure_ascii=False, indent=2)
+    out = io.TextIOWrapper(f, encoding="utf-8", newline="")
+    first = True
+    for r in rows:
+        out.write("[\n  " if first else ",\n  ")
+        out.write(enc.encode(r).replace("\n", "\n  "))
+        first = False
+    out.write("[]" if first else "\n]")
+    out.flush()
+    out.detach()
+
+
 def save_recommendations_json(path: str | Path, rows: Iterable[Dict[str, Any]]) -> None:
     p = Path(path)
     p.parent.mkdir(parents=True, exist_ok=True)
-    with p.open("w", encoding="utf-8") as f:
-        json.dump(list(rows), f, ensure_ascii=False, indent=2)
+    with p.open("wb") as f:
+        write_json(f, rows)
+
+
+_CSV_ROW = operator.itemgetter(*CSV_FIELDS)
+
+
+def write_csv(f: TextIO, rows: Iterable[Dict[str, Any]]) -> None:
+    # Rows are ranked recommendations (sort_recommendations output), so every field is present.
+    w = csv.writer(f)
+    w.writerow(CSV_FIELDS)
+    w.writerows(map(_CSV_ROW, rows))
 
 
 def save_recommendations_csv(path: str | Path, rows: Iterable[Dict[str, Any]]) -> None:
     p = Path(path)
     p.parent.mkdir(parents=True, exist_ok=True)
-    rows_list: List[Dict[str, Any]] = list(rows)
-    fieldnames = ["rank", "score", "title", "author", "genre", "year", "description", "matched_keywords"]
-    with p.open("w", encoding="utf-8", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        w.writeheader()
-        for r in rows_list:
-            w.writerow({k: r.get(k, "") for k in fieldnames})
+    with p.open("w", encoding="utf-8", newline="", buffering=1 << 20) as f:
+        write_csv(f, rows)
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import sys
+from dataclasses import dataclass, field
 from typing import Mapping, Any
 
+from .preprocess import normalize_text
+
 
 @dataclass(frozen=True, slots=True)
 class Book:
@@ -11,6 +14,17 @@ class Book:
     genre: str
     description: str
     year: int
+    # Normalized forms used by scoring; computed once per book instead of on every pass.
+    norm_author: str = field(init=False, repr=False, compare=False)
+    norm_genre: str = field(init=False, repr=False, compare=False)
+    norm_hay: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # Interned: one shared object per distinct author/genre, and set lookups against the
+        # (also interned) preference strings succeed on identity.
+        object.__setattr__(self, "norm_author", sys.intern(normalize_text(self.author)))
+        object.__setattr__(self, "norm_genre", sys.intern(normalize_text(self.genre)))
+        object.__setattr__(self, "norm_hay", normalize_text(f"{self.title} {self.description}"))
 
     @staticmethod
     def from_mapping(m: Mapping[str, Any]) -> "Book":
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import heapq
 from typing import Iterable, Iterator, List, Dict, Any, Optional
 
 from .models import Book
@@ -13,7 +14,7 @@ def filter_only_selected_genres(books: Iterable[Book], genres: set[str]) -> Iter
         return
     norm_genres = {normalize_text(g) for g in genres}
     for b in books:
-        if normalize_text(b.genre) in norm_genres:
+        if b.norm_genre in norm_genres:
             yield b
 
 
@@ -26,22 +27,44 @@ def filter_year_min(books: Iterable[Book], year_min: Optional[int]) -> Iterator[
             yield b
 
 
+def _row(b: Book, score: int, hits: tuple[str, ...]) -> Dict[str, Any]:
+    return {
+        "score": score,
+        "title": b.title,
+        "author": b.author,
+        "genre": b.genre,
+        "year": b.year,
+        "description": b.description,
+        "matched_keywords": ", ".join(hits),
+    }
+
+
 def score_books(books: Iterable[Book], prefs: dict) -> Iterator[Dict[str, Any]]:
     # Generator: yields dict rows with score + metadata.
     for b in books:
-        score, hits = score_book(b, prefs)
-        yield {
-            "score": score,
-            "title": b.title,
-            "author": b.author,
-            "genre": b.genre,
-            "year": b.year,
-            "description": b.description,
-            "matched_keywords": ", ".join(hits),
-        }
-
-
-def sort_recommendations(rows: Iterable[Dict[str, Any]], sort_by: str = "rating") -> List[Dict[str, Any]]:
+        yield _row(b, *score_book(b, prefs))
+
+
+def iter_scored(
+    books: Iterable[Book], prefs: dict, year_min: Optional[int] = None, only_selected: bool = False
+) -> Iterator[Dict[str, Any]]:
+    # filter_only_selected_genres + filter_year_min + score_books in a single pass.
+    # Scoring stays in plain Python rather than a numba kernel: the author/genre sum is ~10% of
+    # the loop, the rest is the keyword string scan and row dicts, which numba cannot speed up.
+    genres = prefs.get("genres", set())
+    only_selected = bool(only_selected and genres)
+    for b in books:
+        if only_selected and b.norm_genre not in genres:
+            continue
+        if year_min and b.year < year_min:
+            continue
+        yield _row(b, *score_book(b, prefs))
+
+
+def sort_recommendations(
+    rows: Iterable[Dict[str, Any]], sort_by: str = "rating", limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    # With limit, only the first `limit` rows are selected (heap, O(N log k)); ranks match a full sort.
     data = list(rows)
 
     if sort_by == "title":
@@ -54,5 +77,12 @@ def sort_recommendations(rows: Iterable[Dict[str, Any]], sort_by: str = "rating"
         key = lambda r: (int(r.get("score", 0)), int(r.get("year", 0)))
         reverse = True
 
-    data_sorted = sorted(data, key=key, reverse=reverse)
-    return [{**r, "rank": i + 1} for i, r in enumerate(data_sorted)]
+    if limit is not None:
+        pick = heapq.nlargest if reverse else heapq.nsmallest
+        data_sorted = pick(limit, data, key=key)
+    else:
+        data_sorted = sorted(data, key=key, reverse=reverse)
+    # Rows are ours (fresh dicts from the scoring generators): set rank in place, no copies.
+    for i, r in enumerate(data_sorted, 1):
+        r["rank"] = i
+    return data_sorted
@@ -1,35 +1,73 @@
 from __future__ import annotations
 
-import re
+import sys
+from functools import lru_cache
 from typing import Iterable, Set, Tuple
 
-_WS = re.compile(r"\s+")
-_PUNCT = re.compile(r"[^\w\s\-]+", flags=re.UNICODE)
+try:
+    import ahocorasick  # optional: one-pass multi-keyword scan (pyahocorasick)
+except ImportError:
+    ahocorasick = None
+
+
+class _PunctTable(dict):
+    # str.translate table: anything outside [\w\s-] becomes a space.
+    # Filled lazily per code point, so only characters actually seen are classified.
+    def __missing__(self, cp: int) -> int:
+        ch = chr(cp)
+        out = cp if ch.isalnum() or ch.isspace() or ch in "_-" else 32
+        self[cp] = out
+        return out
+
+
+_PUNCT = _PunctTable()
 
 
 def normalize_text(s: str) -> str:
-    s = s.lower().strip()
-    s = _PUNCT.sub(" ", s)
-    s = _WS.sub(" ", s)
-    return s.strip()
+    # lower/translate/split/join are one C call each; binding them to module names measured no faster.
+    return " ".join(s.lower().translate(_PUNCT).split())
 
 
 def split_csv_like(s: str) -> Tuple[str, ...]:
     # Split by comma or semicolon.
     if not s.strip():
         return ()
-    parts = re.split(r"[;,]", s)
+    parts = s.replace(";", ",").split(",")
     return tuple(p.strip() for p in parts if p.strip())
 
 
 def to_norm_set(items: Iterable[str]) -> Set[str]:
-    return {normalize_text(x) for x in items if normalize_text(x)}
+    return {sys.intern(n) for x in items if (n := normalize_text(x))}
+
+
+def build_kw_automaton(keywords: Iterable[str]):
+    "Aho-Corasick automaton over the keywords, or None if pyahocorasick is missing or there are none."
+    if ahocorasick is None or not keywords:
+        return None
+    a = ahocorasick.Automaton()
+    for kw in keywords:
+        a.add_word(kw, kw)
+    a.make_automaton()
+    return a
+
+
+@lru_cache(maxsize=256)
+def _norm_frozenset(s: str) -> frozenset:
+    # Cached per raw input string; frozensets are immutable, so sharing them is safe.
+    return frozenset(to_norm_set(split_csv_like(s)))
+
+
+@lru_cache(maxsize=256)
+def _cached_kw_automaton(keywords: frozenset):
+    return build_kw_automaton(keywords)
 
 
 def parse_preferences(genres: str, authors: str, keywords: str) -> dict:
-    "Return normalized preferences dict."
+    "Return normalized preferences dict (a fresh dict; the normalized sets are cached)."
+    kw = _norm_frozenset(keywords)
     return {
-        "genres": to_norm_set(split_csv_like(genres)),
-        "authors": to_norm_set(split_csv_like(authors)),
-        "keywords": to_norm_set(split_csv_like(keywords)),
+        "genres": _norm_frozenset(genres),
+        "authors": _norm_frozenset(authors),
+        "keywords": kw,
+        "_kw_automaton": _cached_kw_automaton(kw),
     }
@@ -2,7 +2,6 @@ from __future__ import annotations
 
 from typing import Set, Tuple
 from .models import Book
-from .preprocess import normalize_text
 
 # Weights (can be tuned)
 W_AUTHOR = 5
@@ -13,20 +12,26 @@ W_KEYWORD = 1
 def _match_author(book: Book, authors: Set[str]) -> bool:
     if not authors:
         return False
-    return normalize_text(book.author) in authors
+    return book.norm_author in authors
 
 
 def _match_genre(book: Book, genres: Set[str]) -> bool:
     if not genres:
         return False
-    return normalize_text(book.genre) in genres
+    return book.norm_genre in genres
 
 
-def _keyword_hits(book: Book, keywords: Set[str]) -> Tuple[int, Tuple[str, ...]]:
+def _keyword_hits(book: Book, keywords: Set[str], automaton=None) -> Tuple[int, Tuple[str, ...]]:
     if not keywords:
         return 0, ()
-    hay = normalize_text(f"{book.title} {book.description}")
-    hits = tuple(sorted({kw for kw in keywords if kw and kw in hay}))
+    hay = book.norm_hay
+    if automaton is not None:
+        hits = tuple(sorted({kw for _, kw in automaton.iter(hay)}))
+    else:
+        # Plain `in` per keyword: a combined "|".join regex measured 2-4x slower here, and
+        # findall would also miss keywords overlapping (or nested in) another match.
+        # keywords is already a set of non-empty strings (to_norm_set), so no dedup set is needed.
+        hits = tuple(sorted(kw for kw in keywords if kw in hay))
     return len(hits), hits
 
 
@@ -42,6 +47,8 @@ def score_book(book: Book, prefs: dict) -> tuple[int, tuple[str, ...]]:
     if _match_genre(book, genres):
         score += W_GENRE
 
-    kcnt, hits = _keyword_hits(book, keywords)
+    if not keywords:
+        return score, ()
+    kcnt, hits = _keyword_hits(book, keywords, prefs.get("_kw_automaton"))
     score += W_KEYWORD * kcnt
     return score, hits
@@ -1,13 +1,20 @@
 from __future__ import annotations
-from flask import Flask, request, render_template_string, send_file
+from flask import Flask, request, send_file, session
+from functools import lru_cache
 from pathlib import Path
-import io, json, csv
+import io
+import os
 
-from recommender.io_utils import load_books_json
+from recommender.models import Book
+from recommender.io_utils import load_books_json, write_csv, write_json
 from recommender.preprocess import parse_preferences
-from recommender.pipeline import filter_only_selected_genres, filter_year_min, score_books, sort_recommendations
+from recommender.pipeline import iter_scored, sort_recommendations
 
 app = Flask(__name__)
+# Signs the session cookie; set FLASK_SECRET_KEY to keep sessions across restarts and workers.
+app.secret_key = os.environ.get("FLASK_SECRET_KEY") or os.urandom(32)
+# Drop the whitespace around block tags ({% for %} etc.) from the rendered page.
+app.jinja_options = {**app.jinja_options, "trim_blocks": True, "lstrip_blocks": True}
 
 TEMPLATE = """
 <!doctype html>
@@ -118,8 +125,28 @@ TEMPLATE = """
 </html>
 """
 
-_LAST_ROWS = []
-_TO_READ = []
+# Compiled once at import; render_template_string would re-parse TEMPLATE on every request.
+_TPL = app.jinja_env.from_string(TEMPLATE)
+
+# Form fields that define a recommendation query, with their defaults.
+_QUERY_DEFAULTS = {
+    "genres": "",
+    "authors": "",
+    "keywords": "",
+    "year_min": "",
+    "only_genres": "no",
+    "sort_by": "rating",
+}
+
+
+@lru_cache(maxsize=4)
+def _cached_books(path: str, mtime_ns: int) -> tuple[Book, ...]:
+    # Parsed once per file version; mtime_ns is only part of the cache key.
+    return tuple(load_books_json(path))
+
+
+def _load_books(path: Path = Path("data/books.json")) -> tuple[Book, ...]:
+    return _cached_books(str(path), path.stat().st_mtime_ns)
 
 
 def _maybe_int(x: str):
@@ -132,40 +159,40 @@ def _maybe_int(x: str):
         return None
 
 
-@app.route("/", methods=["GET", "POST"])
-def index():
-    global _LAST_ROWS, _TO_READ
-
-    genres = authors = keywords = ""
-    year_min = ""
-    only_genres = "no"
-    sort_by = "rating"
-    rows = _LAST_ROWS
-    to_read = _TO_READ
-
-    if request.method == "POST":
-        action = (request.form.get("action") or "recommend").lower()
-
-        genres = request.form.get("genres", "")
-        authors = request.form.get("authors", "")
-        keywords = request.form.get("keywords", "")
-        year_min = request.form.get("year_min", "")
-        only_genres = request.form.get("only_genres", "no")
-        sort_by = request.form.get("sort_by", "rating")
+def _recommend(q: dict) -> list:
+    prefs = parse_preferences(q["genres"], q["authors"], q["keywords"])
+    scored = iter_scored(
+        _load_books(), prefs, year_min=_maybe_int(q["year_min"]), only_selected=q["only_genres"] == "yes"
+    )
+    rows = sort_recommendations(scored, sort_by=q["sort_by"])
+    if any(prefs[k] for k in ("genres", "authors", "keywords")):
+        rows = [r for r in rows if int(r["score"]) > 0]
+    return rows
 
-        prefs = parse_preferences(genres, authors, keywords)
-        books = load_books_json(Path("data/books.json"))
 
-        if only_genres == "yes":
-            books = filter_only_selected_genres(books, prefs["genres"])
-        books = filter_year_min(books, _maybe_int(year_min))
+def _to_read(saved, q=None, rows=None) -> list:
+    # saved: {"q": query, "ranks": [...]} as stored by index(); rows are reused if they answer the same query.
+    if not saved:
+        return []
+    ranks = set(saved["ranks"])
+    if rows is None or saved["q"] != q:
+        rows = _recommend(saved["q"])
+    return [r for r in rows if r["rank"] in ranks]
 
-        rows = sort_recommendations(score_books(books, prefs), sort_by=sort_by)
-        any_pref = any(prefs[k] for k in ("genres", "authors", "keywords"))
-        if any_pref:
-            rows = [r for r in rows if int(r["score"]) > 0]
 
-        _LAST_ROWS = rows
+@app.route("/", methods=["GET", "POST"])
+def index():
+    # Only the query and picked ranks live in the (cookie) session; rows are recomputed
+    # from the cached books, so nothing per-user is retained in the process.
+    form = dict(_QUERY_DEFAULTS)
+    if request.method == "GET":
+        q = session.get("q")
+        rows = _recommend(q) if q else []
+    else:
+        action = (request.form.get("action") or "recommend").lower()
+        form = q = {k: request.form.get(k, v) for k, v in _QUERY_DEFAULTS.items()}
+        rows = _recommend(q)
+        session["q"] = q
 
         if action == "to_read":
             picks = request.form.getlist("pick")
@@ -173,41 +200,32 @@ def index():
                 pick_ranks = {int(x) for x in picks}
             except ValueError:
                 pick_ranks = set()
-            _TO_READ = [r for r in _LAST_ROWS if int(r.get("rank", 0)) in pick_ranks]
-            to_read = _TO_READ
-
-    return render_template_string(
-        TEMPLATE,
-        rows=rows,
-        to_read=to_read,
-        genres=genres,
-        authors=authors,
-        keywords=keywords,
-        year_min=year_min,
-        only_genres=only_genres,
-        sort_by=sort_by,
-    )
+            session["to_read"] = {"q": q, "ranks": sorted(pick_ranks)}
+
+    return _TPL.render(rows=rows, to_read=_to_read(session.get("to_read"), q, rows), **form)
 
 
 @app.route("/export")
 def export():
     kind = (request.args.get("kind") or "recs").lower()
     fmt = (request.args.get("fmt") or "json").lower()
-    rows = _LAST_ROWS if kind == "recs" else _TO_READ
+    if kind == "recs":
+        rows = _recommend(session["q"]) if "q" in session else []
+    else:
+        rows = _to_read(session.get("to_read"))
 
     if fmt == "csv":
-        buf = io.StringIO()
-        fieldnames = ["rank", "score", "title", "author", "genre", "year", "description", "matched_keywords"]
-        w = csv.DictWriter(buf, fieldnames=fieldnames)
-        w.writeheader()
-        for r in rows:
-            w.writerow({k: r.get(k, "") for k in fieldnames})
-        mem = io.BytesIO(buf.getvalue().encode("utf-8"))
+        # Encode straight into the response buffer (no intermediate str + encode copy).
+        mem = io.BytesIO()
+        text = io.TextIOWrapper(mem, encoding="utf-8", newline="")
+        write_csv(text, rows)
+        text.detach()
         mem.seek(0)
         name = "recommendations.csv" if kind == "recs" else "to_read.csv"
         return send_file(mem, as_attachment=True, download_name=name, mimetype="text/csv")
 
-    mem = io.BytesIO(json.dumps(rows, ensure_ascii=False, indent=2).encode("utf-8"))
+    mem = io.BytesIO()
+    write_json(mem, rows)
     mem.seek(0)
     name = "recommendations.json" if kind == "recs" else "to_read.json"
     return send_file(mem, as_attachment=True, download_name=name, mimetype="application/json")